@@ -1,107 +1,360 @@
 import os
+import atexit
+import hashlib
 import threading
 import json
 import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify
+from functools import lru_cache
+from flask import Flask, Response, render_template, request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.middleware.proxy_fix import ProxyFix
 from websocket import create_connection
-import pandas as pd
 import numpy as np
+import orjson
+
+try:
+    from numba import njit
+except ImportError: # sem numba os kernels correm em Python puro
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]): return args[0]
+        return lambda f: f
+
+class ORJSONProvider(DefaultJSONProvider):
+    """request.get_json via orjson (C); as respostas já saem em bytes pré-codificados com orjson.dumps"""
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+# proxies de confiança à frente da app (o Procfile usa 1 para o router do PaaS); a 0 o X-Forwarded-For é ignorado
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES > 0: app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+# os ficheiros de /static levam ?v=<hash> no index.html, por isso o browser pode guardá-los um ano
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = timedelta(days=365)
+
+@lru_cache(maxsize=None)
+def static_version(filename):
+    """Hash curto do conteúdo de um ficheiro estático (muda a cada deploy que o altere)"""
+    with open(os.path.join(app.static_folder, filename), 'rb') as f: return hashlib.md5(f.read()).hexdigest()[:10]
+
+app.jinja_env.globals['static_version'] = static_version
 
 BOT_STATUS = "OFF"
-LOG_MESSAGES = []
-FINAL_SIGNAL_DATA = {
-    'direction': 'AGUARDANDO', 
-    'confidence': 0, 
-    'justification': 'O Sniper está a calibrar os sensores...',
-    'strategy_used': 'Nenhuma',
-    'symbol_name': 'Nenhum'
+STATE_LOCK = threading.Lock()
+WS_TIMEOUT = 20 # segundos: nenhum recv() à Deriv fica pendurado para sempre
+PING_TIMEOUT = 2 # teste rápido do websocket em cache: um socket meio-aberto não pode gastar o AUTH_TIMEOUT
+AUTH_TIMEOUT = float(os.environ.get('DERIV_AUTH_TIMEOUT', 10)) # espera máxima de /control pela autorização
+BOT_THREAD = None # thread do bot_loop em curso (no máximo uma)
+WS_CONN = None # (token, websocket) autorizado, reaproveitado entre paragens do bot
+STOP_EVENT = threading.Event()
+AUTH_EVENT = threading.Event() # sinalizado quando a autorização na Deriv termina (ok ou erro)
+LOG_MESSAGES = deque(maxlen=50) # os logs mais antigos saem sozinhos, em O(1)
+LOG_SNAPSHOT = () # cópia imutável publicada a cada log: /status lê-a sem locks
+LOG_LOCK = threading.Lock()
+
+@dataclass(slots=True, frozen=True)
+class SignalData:
+    """Último sinal publicado (imutável: o bot troca a referência inteira); o orjson serializa-o em /status"""
+    direction: str = 'AGUARDANDO'
+    confidence: int = 0
+    justification: str = 'O Sniper está a calibrar os sensores...'
+    strategy_used: str = 'Nenhuma'
+    symbol_name: str = 'Nenhum'
+
+FINAL_SIGNAL_DATA = SignalData()
+
+# Revisão do estado exposto em /status (ETag): muda a cada log, sinal ou ON/OFF.
+# O prefixo distingue arranques do processo para que um ETag antigo nunca coincida.
+STATUS_REV = 0
+REV_LOCK = threading.Lock()
+ETAG_PREFIX = format(time.time_ns(), 'x')
+STATUS_CACHE = (None, b'') # (etag, corpo JSON de /status) da última revisão serializada
+
+def bump_status():
+    global STATUS_REV
+    with REV_LOCK: STATUS_REV += 1
+
+def set_bot_status(status):
+    global BOT_STATUS
+    BOT_STATUS = status
+    bump_status()
+
+# /control só pode responder ON ou OFF: corpos JSON serializados uma única vez
+CONTROL_BODIES = {status: orjson.dumps({'status': status}) for status in ("ON", "OFF")}
+CONTROL_ERRORS = {
+    400: orjson.dumps({'error': 'Pedido inválido: action (start/stop), token e symbol são obrigatórios'}),
+    409: orjson.dumps({'error': 'O bot anterior ainda está a terminar. Tente novamente daqui a pouco.'}),
+    429: orjson.dumps({'error': 'Demasiados arranques. Tente novamente daqui a pouco.'}),
 }
 
 def add_log(message):
-    global LOG_MESSAGES
+    global LOG_SNAPSHOT
     timestamp = datetime.now().strftime('%H:%M:%S')
-    LOG_MESSAGES.append(f"[{timestamp}] {message}")
-    if len(LOG_MESSAGES) > 50: LOG_MESSAGES.pop(0)
+    with LOG_LOCK:
+        LOG_MESSAGES.append(f"[{timestamp}] {message}")
+        LOG_SNAPSHOT = tuple(LOG_MESSAGES)
+    bump_status()
+
+# Assinaturas explícitas: o numba compila (ou lê da cache) ao importar o módulo,
+# no arranque do worker, e não no primeiro sinal do bot.
+@njit("f8[:](f8[:], i8)", cache=True)
+def _rsi_kernel(close, period):
+    n = close.shape[0]
+    rsi = np.full(n, np.nan)
+    gains = np.zeros(n)
+    losses = np.zeros(n)
+    for i in range(1, n):
+        d = close[i] - close[i - 1]
+        if d > 0: gains[i] = d
+        elif d < 0: losses[i] = -d
+    sum_gain = 0.0
+    sum_loss = 0.0
+    for i in range(n):
+        sum_gain += gains[i]
+        sum_loss += losses[i]
+        if i >= period:
+            sum_gain -= gains[i - period]
+            sum_loss -= losses[i - period]
+        if i >= period - 1:
+            if sum_loss > 0: rsi[i] = 100.0 - 100.0 / (1.0 + sum_gain / sum_loss)
+            elif sum_gain > 0: rsi[i] = 100.0
+    return rsi
+
+@njit("UniTuple(f8[:], 2)(f8[:], i8)", cache=True)
+def _sma_std_kernel(close, period):
+    n = close.shape[0]
+    sma = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    for i in range(period - 1, n):
+        window = close[i - period + 1:i + 1]
+        mean = window.sum() / period
+        sma[i] = mean
+        std[i] = np.sqrt(((window - mean) ** 2).sum() / (period - 1))
+    return sma, std
+
+@njit("f8[:](f8[:], i8)", cache=True)
+def _ema_kernel(close, span):
+    n = close.shape[0]
+    ema = np.empty(n)
+    if n == 0: return ema
+    alpha = 2.0 / (span + 1.0)
+    ema[0] = close[0]
+    for i in range(1, n):
+        ema[i] = alpha * close[i] + (1.0 - alpha) * ema[i - 1]
+    return ema
+
+CANDLE_COLUMNS = (('Open', 'open'), ('High', 'high'), ('Low', 'low'), ('Close', 'close'))
+
+def candles_to_arrays(candles):
+    """Velas da Deriv -> uma coluna NumPy float64 por campo (sem DataFrame no ciclo do bot)"""
+    return {name: np.fromiter((c[key] for c in candles), dtype=np.float64, count=len(candles)) for name, key in CANDLE_COLUMNS}
 
 def calculate_indicators(df):
-    delta = df['Close'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    df['RSI'] = 100 - (100 / (1 + (gain / loss)))
-    df['SMA_20'] = df['Close'].rolling(window=20).mean()
-    df['STD'] = df['Close'].rolling(window=20).std()
-    df['BBU'] = df['SMA_20'] + (df['STD'] * 2)
-    df['BBL'] = df['SMA_20'] - (df['STD'] * 2)
-    df['EMA_10'] = df['Close'].ewm(span=10, adjust=False).mean()
+    close = df['Close']
+    df['RSI'] = _rsi_kernel(close, 14)
+    sma, std = _sma_std_kernel(close, 20)
+    df['SMA_20'] = sma
+    df['STD'] = std
+    df['BBU'] = sma + (std * 2)
+    df['BBL'] = sma - (std * 2)
+    df['EMA_10'] = _ema_kernel(close, 10)
     return df
 
 def automatic_sniper_engine(df):
     """O bot decide qual a melhor estratégia para a vela atual"""
-    c = df.iloc[-1]
-    body = abs(c['Close'] - c['Open'])
-    high_wick = c['High'] - max(c['Open'], c['Close'])
-    low_wick = min(c['Open'], c['Close']) - c['Low']
+    # valores da vela atual (última posição de cada coluna) lidos uma vez
+    o, h, l, close = df['Open'][-1], df['High'][-1], df['Low'][-1], df['Close'][-1]
+    rsi, ema, bbu, bbl = df['RSI'][-1], df['EMA_10'][-1], df['BBU'][-1], df['BBL'][-1]
+    body = abs(close - o)
+    high_wick = h - max(o, close)
+    low_wick = min(o, close) - l
     
     # 1º FILTRO: BUSCA POR SNIPER (99% - Prioridade Máxima)
-    if c['RSI'] > 78 and c['High'] >= c['BBU'] and high_wick > (body * 0.8):
+    if rsi > 78 and h >= bbu and high_wick > (body * 0.8):
         return "PUT", "🎯 SNIPER DETECTADO: Rejeição extrema no topo. Probabilidade 99%.", 99, "Sniper Elite"
     
-    if c['RSI'] < 22 and c['Low'] <= c['BBL'] and low_wick > (body * 0.8):
+    if rsi < 22 and l <= bbl and low_wick > (body * 0.8):
         return "CALL", "🎯 SNIPER DETECTADO: Suporte de exaustão atingido. Probabilidade 99%.", 99, "Sniper Elite"
 
     # 2º FILTRO: BUSCA POR FLUXO (85% - Se não houver Sniper, ele vê se há força)
     if body > (high_wick + low_wick) * 2.5: # Vela de corpo muito forte
-        if c['Close'] > c['Open'] and c['Close'] > c['EMA_10'] and c['RSI'] < 65:
+        if close > o and close > ema and rsi < 65:
             return "CALL", "🌊 FLUXO DE ALTA: Vela de força rompendo média. Probabilidade 85%.", 85, "Momentum Flow"
-        if c['Close'] < c['Open'] and c['Close'] < c['EMA_10'] and c['RSI'] > 35:
+        if close < o and close < ema and rsi > 35:
             return "PUT", "🌊 FLUXO DE BAIXA: Vela de força rompendo média. Probabilidade 85%.", 85, "Momentum Flow"
 
     return "NEUTRA", "Mercado sem padrão Sniper ou Fluxo. Aguardando...", 0, "A analisar"
 
-def bot_loop(token, symbol):
-    global BOT_STATUS, FINAL_SIGNAL_DATA
-    add_log(f"🚀 Sniper calibrado para {symbol}. A iniciar...")
+def close_connection():
+    global WS_CONN
+    if WS_CONN:
+        try: WS_CONN[1].close()
+        except Exception: pass
+    WS_CONN = None
+
+def deriv_connection(token):
+    """Devolve um websocket autorizado, reaproveitando o anterior se o token for o mesmo e ainda responder"""
+    global WS_CONN
+    if WS_CONN and WS_CONN[0] == token:
+        ws = WS_CONN[1]
+        try:
+            ws.settimeout(PING_TIMEOUT)
+            ws.send(json.dumps({"ping": 1}))
+            if "ping" in json.loads(ws.recv()):
+                ws.settimeout(WS_TIMEOUT)
+                return ws, None
+        except Exception: pass
+    close_connection()
+    ws = create_connection("wss://ws.derivws.com/websockets/v3?app_id=114910", timeout=WS_TIMEOUT)
     try:
-        ws = create_connection("wss://ws.derivws.com/websockets/v3?app_id=114910")
         ws.send(json.dumps({"authorize": token}))
         auth = json.loads(ws.recv())
-        if "error" in auth:
-            add_log("❌ TOKEN INVÁLIDO!")
-            BOT_STATUS = "OFF"; return
+    except Exception: # ainda não está em WS_CONN: o close_connection() do bot_loop não o fecharia
+        ws.close()
+        raise
+    if "error" in auth:
+        ws.close()
+        return None, auth['error']
+    WS_CONN = (token, ws)
+    return ws, None
+
+def bot_loop(token, symbol):
+    global FINAL_SIGNAL_DATA
+    add_log(f"🚀 Sniper calibrado para {symbol}. A iniciar...")
+    try:
+        ws, error = deriv_connection(token)
+        if error:
+            add_log(f"❌ TOKEN INVÁLIDO! ({error.get('message', error.get('code'))})")
+            set_bot_status("OFF"); AUTH_EVENT.set(); return
+        AUTH_EVENT.set()
 
         add_log(f"✅ CONECTADO! Motor de Inteligência Ativo.")
-        while BOT_STATUS == "ON":
+        while not STOP_EVENT.is_set():
             ws.send(json.dumps({"ticks_history": symbol, "end": "latest", "count": 60, "style": "candles", "granularity": 300}))
             data = json.loads(ws.recv())
             if "candles" in data:
-                df = calculate_indicators(pd.DataFrame(data['candles']).rename(columns={'open':'Open','high':'High','low':'Low','close':'Close'}))
+                df = calculate_indicators(candles_to_arrays(data['candles']))
                 dir, just, conf, strat = automatic_sniper_engine(df)
-                FINAL_SIGNAL_DATA.update({'direction': dir, 'confidence': conf, 'justification': just, 'strategy_used': strat, 'symbol_name': symbol})
+                FINAL_SIGNAL_DATA = SignalData(dir, conf, just, strat, symbol)
+                bump_status()
                 if dir != "NEUTRA": add_log(f"🔥 SINAL: {dir} ({conf}%)")
-            time.sleep(15)
-        ws.close()
+            STOP_EVENT.wait(15) # acorda logo que o bot for desligado
+        # a ligação fica aberta em WS_CONN para o próximo arranque com o mesmo token
     except Exception as e:
-        add_log(f"⚠️ Erro: {e}"); BOT_STATUS = "OFF"
+        close_connection()
+        add_log(f"⚠️ Erro: {e}"); set_bot_status("OFF"); AUTH_EVENT.set()
+
+@lru_cache(maxsize=1)
+def _index_page():
+    """O index.html não tem variáveis dinâmicas: renderiza uma vez e guarda os bytes + ETag"""
+    body = render_template('index.html').encode('utf-8')
+    return body, hashlib.md5(body).hexdigest()
 
 @app.route('/')
-def index(): return render_template('index.html')
+def index():
+    body, etag = _index_page()
+    resp = Response(body, mimetype='text/html')
+    resp.set_etag(etag)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = 60
+    return resp.make_conditional(request)
+
+CONTROL_LIMIT = 5 # arranques permitidos por IP...
+CONTROL_WINDOW = 60 # ...nesta janela (segundos)
+CONTROL_MAX_IPS = 1024 # teto da tabela: o IP com o arranque mais antigo sai primeiro
+CONTROL_HITS = OrderedDict() # ip -> deque com os instantes dos últimos arranques
+RATE_LOCK = threading.Lock()
+
+def start_rate_limited(ip):
+    """Janela deslizante por IP: cada arranque abre um websocket à Deriv"""
+    now = time.monotonic()
+    with RATE_LOCK:
+        hits = CONTROL_HITS.setdefault(ip, deque())
+        CONTROL_HITS.move_to_end(ip)
+        if len(CONTROL_HITS) > CONTROL_MAX_IPS: CONTROL_HITS.popitem(last=False)
+        while hits and now - hits[0] > CONTROL_WINDOW: hits.popleft()
+        if len(hits) >= CONTROL_LIMIT: return True
+        hits.append(now)
+        return False
+
+def start_bot(token, symbol):
+    """Lança o bot_loop se estiver desligado; devolve True se arrancou uma nova thread"""
+    global BOT_THREAD
+    if BOT_STATUS == "ON": return False
+    set_bot_status("ON")
+    STOP_EVENT.clear()
+    AUTH_EVENT.clear()
+    BOT_THREAD = threading.Thread(target=bot_loop, args=(token, symbol), name=f"bot-{symbol}", daemon=True)
+    BOT_THREAD.start()
+    return True
+
+def previous_bot_running():
+    """O bot_loop anterior ainda não saiu: limpar STOP_EVENT agora deixá-lo-ia a correr"""
+    return BOT_STATUS == "OFF" and BOT_THREAD is not None and BOT_THREAD.is_alive()
+
+def stop_bot(token, symbol):
+    set_bot_status("OFF")
+    STOP_EVENT.set()
+    return False
+
+CONTROL_ACTIONS = {'start': start_bot, 'stop': stop_bot}
+
+@atexit.register
+def shutdown():
+    """Paragem limpa do worker: termina o bot_loop e fecha o websocket à Deriv"""
+    STOP_EVENT.set()
+    if BOT_THREAD is not None: BOT_THREAD.join(WS_TIMEOUT)
+    close_connection()
+
+def parse_control(data):
+    """Valida o corpo de /control sem exceções: devolve (action, token, symbol) ou None"""
+    if not isinstance(data, dict): return None
+    action, token, symbol = data.get('action'), data.get('token'), data.get('symbol')
+    if action not in CONTROL_ACTIONS: return None
+    if action == 'start' and not (isinstance(token, str) and token and isinstance(symbol, str) and symbol): return None
+    return action, token, symbol
 
 @app.route('/control', methods=['POST'])
 def control():
-    global BOT_STATUS
-    data = request.json
-    if data['action'] == 'start' and BOT_STATUS == "OFF":
-        BOT_STATUS = "ON"
-        threading.Thread(target=bot_loop, args=(data['token'], data['symbol'])).start()
-    else: BOT_STATUS = "OFF"
-    return jsonify({'status': BOT_STATUS})
+    parsed = parse_control(request.get_json(silent=True))
+    if parsed is None: return Response(CONTROL_ERRORS[400], status=400, mimetype='application/json')
+    action, token, symbol = parsed
+    if action == 'start' and start_rate_limited(request.remote_addr or ''):
+        return Response(CONTROL_ERRORS[429], status=429, mimetype='application/json')
+    previous = BOT_THREAD
+    if action == 'start' and previous is not None and BOT_STATUS == "OFF":
+        previous.join(WS_TIMEOUT) # fora do STATE_LOCK: um "stop" concorrente não fica à espera
+    with STATE_LOCK: # dois "start" em threads diferentes não podem lançar dois bots
+        busy = action == 'start' and previous_bot_running()
+        started = not busy and CONTROL_ACTIONS[action](token, symbol)
+    if busy:
+        add_log("⏳ O bot anterior ainda não terminou. Arranque ignorado.")
+        return Response(CONTROL_ERRORS[409], status=409, mimetype='application/json')
+    if started: AUTH_EVENT.wait(AUTH_TIMEOUT) # responde com o estado real assim que a Deriv autorizar
+    return Response(CONTROL_BODIES[BOT_STATUS], mimetype='application/json')
 
 @app.route('/status')
-def get_status(): return jsonify({'status': BOT_STATUS, 'logs': LOG_MESSAGES, 'signal': FINAL_SIGNAL_DATA})
+def get_status():
+    global STATUS_CACHE
+    # o browser revalida com If-None-Match: sem mudanças responde 304 sem serializar nada
+    etag = f"{ETAG_PREFIX}-{STATUS_REV}"
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        # serializa uma vez por revisão; todos os painéis partilham os mesmos bytes
+        cached_etag, body = STATUS_CACHE
+        if cached_etag != etag:
+            body = orjson.dumps({'status': BOT_STATUS, 'logs': LOG_SNAPSHOT, 'signal': FINAL_SIGNAL_DATA})
+            STATUS_CACHE = (etag, body)
+        resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    resp.cache_control.no_cache = True
+    return resp
 
 if __name__ == '__main__':
+    from waitress import serve # servidor WSGI de produção (o app.run do Flask é só para desenvolvimento)
     port = int(os.environ.get('PORT', 10000))
-    app.run(host='0.0.0.0', port=port)
+    serve(app, host='0.0.0.0', port=port, threads=8)
@@ -1,80 +1,58 @@
-// Variáveis Globais
-let confidence = 0;
-const alertSound = new Audio('https://actions.google.com/sounds/v1/alarms/beep_short.ogg');
+const beep = document.getElementById('beep');
+let last = "";
 
-// 1. Cronómetro de Fecho de Vela (5 minutos)
-function updateCandleTimer() {
-    const now = new Date();
-    const min = now.getUTCMinutes();
-    const sec = now.getUTCSeconds();
-    
-    const remMin = 4 - (min % 5);
-    const remSec = 59 - sec;
-    
-    const timerElement = document.getElementById('candle-countdown');
-    if(timerElement) {
-        timerElement.innerText = `${remMin.toString().padStart(2,'0')}:${remSec.toString().padStart(2,'0')}`;
-    }
-
-    // Tocar alerta sonoro nos últimos 2 segundos se houver sinal forte
-    if (remMin === 0 && remSec <= 2 && confidence >= 85) {
-        alertSound.play();
-    }
+function showStatus(status) {
+    document.getElementById('st-text').innerText = status;
+    document.getElementById('st-text').className = status === 'ON' ? 'status-on' : 'status-off';
 }
-setInterval(updateCandleTimer, 1000);
 
-// 2. Função para Ligar/Desligar o Bot
-async function controlBot(action) {
-    const token = document.getElementById('api-token-input').value;
-    const symbol = document.getElementById('symbol-select').value;
-    
+async function run(a) {
+    beep.play().catch(()=>{});
     const res = await fetch('/control', {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({action: action, symbol: symbol, api_token: token})
+        body: JSON.stringify({action: a, token: document.getElementById('token').value, symbol: document.getElementById('symbol').value})
     });
-    const data = await res.json();
-    document.getElementById('bot-status-text').innerText = data.status;
+    // /control só responde depois da autorização na Deriv: mostra já o resultado
+    const d = await res.json().catch(() => ({}));
+    if (d.status) showStatus(d.status);
+    else if (d.error) alert(d.error);
 }
 
-// 3. Atualização de Sinais e Logs
-async function pollStatus() {
+// Um único pedido /status de cada vez: o próximo só é agendado quando este termina
+async function poll() {
     try {
-        const response = await fetch('/status');
-        const data = await response.json();
-        const sig = data.signal_data;
-        confidence = sig.confidence;
+        const res = await fetch('/status');
+        const d = await res.json();
+
+        showStatus(d.status);
 
-        // Atualiza Logs
-        const logArea = document.getElementById('log-area');
-        logArea.textContent = data.logs.join('\n');
-        logArea.scrollTop = logArea.scrollHeight;
+        const logs = document.getElementById('log-area');
+        logs.innerText = d.logs.join('\n');
+        logs.scrollTop = logs.scrollHeight;
 
-        // Atualiza Interface de Sinal
-        document.getElementById('main-direction-text').innerText = sig.direction;
-        document.getElementById('confidence-text').innerText = sig.confidence + '%';
-        document.getElementById('strategy-text').innerText = sig.strategy_used;
-        document.getElementById('justification-text').innerText = sig.justification;
-        document.getElementById('indicator-status-text').innerText = sig.indicator_status;
-        document.getElementById('signal-entry-time').innerText = sig.entry_time;
-        document.getElementById('signal-exit-time').innerText = sig.exit_time;
+        const s = d.signal;
+        document.getElementById('dir').innerText = s.direction;
+        document.getElementById('just').innerText = s.justification;
+        document.getElementById('strat').innerText = s.strategy_used;
+        document.getElementById('conf').innerText = s.confidence;
+        document.getElementById('sym-name').innerText = `ANALISANDO: ${s.symbol_name}`;
 
-        // Cores Dinâmicas
-        const headerBox = document.getElementById('signal-header-box');
-        if (sig.direction === 'CALL') headerBox.style.backgroundColor = "#059669";
-        else if (sig.direction === 'PUT') headerBox.style.backgroundColor = "#dc2626";
-        else headerBox.style.backgroundColor = "#374151";
+        const box = document.getElementById('dir');
+        const card = document.getElementById('main-card');
 
-        // Efeito Sniper (Borda Dourada)
-        const card = document.getElementById('signal-display-card');
-        if (sig.confidence >= 98) {
-            card.style.border = "8px solid #fbbf24";
-            document.body.style.backgroundColor = "#1a1405";
+        if(s.direction === 'CALL') box.style.color = '#02c076';
+        else if(s.direction === 'PUT') box.style.color = '#f84960';
+        else box.style.color = '#fff';
+
+        if(s.confidence >= 98) {
+            card.classList.add('sniper-mode');
+            if(last !== s.direction) beep.play();
         } else {
-            card.style.border = "none";
-            document.body.style.backgroundColor = "#121417";
+            card.classList.remove('sniper-mode');
         }
-
-    } catch (e) { console.error("Erro na sincronização:", e); }
+        last = s.direction;
+    } catch(e){}
+    setTimeout(poll, 2000);
 }
-setInterval(pollStatus, 2000);
+poll();